@@ -4,7 +4,7 @@
 # licenses: MIT 
 __version__= "1.1.1"
 
-from .dev.podman2deb import build, list_tags, clean, update, build_info
+from .dev.podman2deb import build, list_tags, clean, update, build_info, prefetch, lock
 from .dev.models import Debinfo, Repo, RepoName
 # from .gpkgs import message as msg
 from .gpkgs.nargs import Nargs
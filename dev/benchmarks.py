@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+import os
+import subprocess
+import sys
+import typing
+
+from ..gpkgs import message as msg
+
+# modules that only --build, --clean and --update need, they must not be loaded when the package is imported.
+STARTUP_FORBIDDEN_MODULES=[
+    "requests",
+    "tarfile",
+    "dev.install_deps",
+    "gpkgs.semver",
+]
+
+def get_importtime(
+    direpa_script:str,
+):
+    # returns {module: cumulative_us} from python -X importtime for a fresh import of the package.
+    direpa_script_parent=os.path.dirname(direpa_script)
+    module_name=os.path.basename(direpa_script)
+    code=f"import sys; sys.path.insert(0, {direpa_script_parent!r}); import {module_name}"
+    proc=subprocess.run([sys.executable, "-X", "importtime", "-c", code], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise Exception(proc.stderr)
+
+    # import time: self [us] | cumulative | imported package
+    # import time:       120 |        340 |   podman2deb.dev.models
+    modules:dict[str, int]=dict()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        elems=line[len("import time:"):].split("|")
+        if len(elems) != 3 or not elems[1].strip().isdigit():
+            continue
+        modules[elems[2].strip()]=int(elems[1].strip())
+    return modules
+
+def bench_startup(
+    direpa_script:str,
+    max_ms:float|None=None,
+    runs:int=5,
+):
+    module_name=os.path.basename(direpa_script)
+    timings:list[float]=[]
+    modules:dict[str, int]=dict()
+    for _ in range(runs):
+        modules=get_importtime(direpa_script)
+        timings.append(modules[module_name]/1000)
+    best_ms=min(timings)
+    msg.info(f"Package import time: best {best_ms:.1f}ms, worst {max(timings):.1f}ms over {runs} runs")
+
+    loaded=[]
+    for name in STARTUP_FORBIDDEN_MODULES:
+        for module in modules:
+            if f".{name}." in f".{module}.":
+                loaded.append(module)
+    if len(loaded) > 0:
+        raise Exception(f"Startup regression, build-only modules are imported eagerly: {', '.join(sorted(set(loaded)))}")
+
+    if max_ms is not None and best_ms > max_ms:
+        raise Exception(f"Startup regression, package import takes {best_ms:.1f}ms which is over {max_ms}ms")
+
+    return best_ms
+
+DAY=86400
+# 2015-01-01
+START_EPOCH=1420070400
+
+def gen_go_tags(count:int):
+    # go1.21beta1, go1.21rc1, go1.21, go1.21.1, ... patch releases of a minor overlap the next minors.
+    patches=20
+    tags:list[tuple[str, tuple|None, int]]=[]
+    for minor in range(1, max(1, count // (patches+3))+1):
+        base=START_EPOCH+minor*180*DAY
+        tags.append((f"go1.{minor}beta1", None, base-30*DAY))
+        tags.append((f"go1.{minor}rc1", None, base-10*DAY))
+        tags.append((f"go1.{minor}", (1, minor, 0), base))
+        for patch in range(1, patches+1):
+            tags.append((f"go1.{minor}.{patch}", (1, minor, patch), base+patch*20*DAY))
+    return tags
+
+def gen_semver_tags(count:int, prefix:str):
+    # v1.2.3 with a v1.2.0-rc1 before each minor release.
+    tags:list[tuple[str, tuple|None, int]]=[]
+    epoch=START_EPOCH
+    major, minor, patch=1, 0, 0
+    while len(tags) < count:
+        epoch+=DAY
+        if patch == 0:
+            tags.append((f"{prefix}{major}.{minor}.0-rc1", None, epoch-DAY//2))
+        tags.append((f"{prefix}{major}.{minor}.{patch}", (major, minor, patch), epoch))
+        patch+=1
+        if patch == 10:
+            patch=0
+            minor+=1
+            if minor == 20:
+                minor=0
+                major+=1
+    return tags
+
+def gen_passt_tags(count:int):
+    # 2023_01_23.abc1234 one tag per day.
+    import hashlib
+    from datetime import datetime, timezone
+    tags:list[tuple[str, tuple|None, int]]=[]
+    for i in range(count):
+        epoch=START_EPOCH+i*DAY
+        date=datetime.fromtimestamp(epoch, tz=timezone.utc)
+        sha=hashlib.sha1(str(i).encode()).hexdigest()[:7]
+        tags.append((f"{date:%Y_%m_%d}.{sha}", (epoch,), epoch))
+    return tags
+
+def gen_mandown_tags(count:int):
+    # v1.0.3 followed by four-part tags v1.0.3.1, v1.0.3.2 ...
+    tags:list[tuple[str, tuple|None, int]]=[]
+    epoch=START_EPOCH
+    major, minor, patch=1, 0, 0
+    while len(tags) < count:
+        for build in range(0, 4):
+            epoch+=DAY
+            if build == 0:
+                tags.append((f"v{major}.{minor}.{patch}", (major, minor, patch, 0), epoch))
+            else:
+                tags.append((f"v{major}.{minor}.{patch}.{build}", (major, minor, patch, build), epoch))
+        patch+=1
+        if patch == 10:
+            patch=0
+            minor+=1
+    return tags
+
+def create_tags_repo(
+    direpa_repo:str,
+    tags:list[tuple[str, tuple|None, int]],
+):
+    # one empty commit per tag with its author date, written with git fast-import for speed.
+    os.makedirs(direpa_repo, exist_ok=True)
+    subprocess.run(["git", "init", "-q", direpa_repo], check=True)
+    lines:list[str]=[]
+    for i, (tag, _, epoch) in enumerate(sorted(tags, key=lambda t: t[2])):
+        lines.extend([
+            "commit refs/heads/main",
+            f"mark :{i+1}",
+            f"author bench <bench@localhost> {epoch} +0000",
+            f"committer bench <bench@localhost> {epoch} +0000",
+            "data 0",
+            "",
+            f"reset refs/tags/{tag}",
+            f"from :{i+1}",
+            "",
+        ])
+    subprocess.run(["git", "fast-import", "--quiet"], cwd=direpa_repo, input="\n".join(lines).encode(), check=True)
+
+def expected_closest_tag(
+    tags:list[tuple[str, tuple|None, int]],
+    epoch:int,
+):
+    # newest stable version whose commit is not after epoch.
+    candidates=[(key, tag) for tag, key, tag_epoch in tags if key is not None and tag_epoch <= epoch]
+    if len(candidates) == 0:
+        return None
+    return max(candidates)[1]
+
+def bench_tags(
+    count:int=2000,
+    max_ms:float|None=None,
+):
+    from datetime import datetime, timezone
+    import tempfile
+    import time
+    from .models import Repo, RepoName
+    from .podman2deb import get_closest_tag, get_latest_tag, list_tags
+
+    schemes=[
+        (RepoName.GO, "go", gen_go_tags(count)),
+        (RepoName.PODMAN, "v", gen_semver_tags(count, "v")),
+        (RepoName.RUST, "", gen_semver_tags(count, "")),
+        (RepoName.PASST, "", gen_passt_tags(count)),
+        (RepoName.MANDOWN, "v", gen_mandown_tags(count)),
+    ]
+    results:list[dict]=[]
+    errors:list[str]=[]
+    with tempfile.TemporaryDirectory() as direpa_sources:
+        for name, prefix, tags in schemes:
+            repo=Repo(name=name, giturl="", prefix=prefix)
+            repo.path=os.path.join(direpa_sources, name)
+            create_tags_repo(repo.path, tags)
+
+            cases:list[tuple[str, typing.Callable[[], typing.Any], typing.Any]]=[]
+            if name not in [RepoName.PASST, RepoName.MANDOWN]:
+                expected=max((key, tag) for tag, key, _ in tags if key is not None)[1]
+                cases.append(("get_latest_tag", lambda: get_latest_tag(repo), expected))
+                cases.append(("list_tags", lambda: set(list_tags(direpa_sources, repo)), set(tag for tag, _, _ in tags)))
+
+            epochs=sorted(epoch for _, _, epoch in tags)
+            for ratio in [0.1, 0.5, 0.9]:
+                epoch=epochs[int(len(epochs)*ratio)]+DAY//4
+                commit_time=datetime.fromtimestamp(epoch, tz=timezone.utc)
+                cases.append((
+                    f"get_closest_tag@{ratio}",
+                    lambda commit_time=commit_time: get_closest_tag(repo, commit_time, trigger_error=False),
+                    expected_closest_tag(tags, epoch),
+                ))
+            cases.append((
+                "get_closest_tag@before",
+                lambda: get_closest_tag(repo, datetime.fromtimestamp(START_EPOCH-DAY, tz=timezone.utc), trigger_error=False),
+                None,
+            ))
+
+            for case, fun, expected in cases:
+                start=time.perf_counter()
+                result=fun()
+                duration_ms=(time.perf_counter()-start)*1000
+                results.append(dict(repo=name, tags=len(tags), case=case, ms=round(duration_ms, 1)))
+                msg.info(f"{name} {len(tags)} tags {case}: {duration_ms:.1f}ms")
+                if result != expected:
+                    errors.append(f"{name} {case}: expected {expected!r}, got {result!r}")
+                if max_ms is not None and duration_ms > max_ms:
+                    errors.append(f"{name} {case}: {duration_ms:.1f}ms is over {max_ms}ms")
+
+    if len(errors) > 0:
+        raise Exception("Tag resolution regression:\n"+"\n".join(errors))
+    return results
+
+def bench_strip():
+    # checks that binaries built by gcc and rustc are stripped and their debug info keyed by build-id.
+    import shutil
+    import tempfile
+    import time
+    from .podman2deb import generate_md5sums, get_elf_info
+
+    errors:list[str]=[]
+    with tempfile.TemporaryDirectory() as direpa_tmp:
+        direpa_pkg=os.path.join(direpa_tmp, "pkg")
+        direpa_dbgsym=os.path.join(direpa_tmp, "pkg-dbgsym")
+        direpa_bin=os.path.join(direpa_pkg, "usr", "bin")
+        os.makedirs(direpa_bin)
+        os.makedirs(os.path.join(direpa_pkg, "DEBIAN"))
+        os.makedirs(os.path.join(direpa_dbgsym, "DEBIAN"))
+
+        filenpa_c=os.path.join(direpa_tmp, "hello.c")
+        with open(filenpa_c, "w") as f:
+            f.write("int main(void){return 0;}\n")
+        subprocess.run(["gcc", "-g", "-Wl,--build-id", "-o", os.path.join(direpa_bin, "hello-c"), filenpa_c], check=True)
+        if shutil.which("rustc") is not None:
+            filenpa_rs=os.path.join(direpa_tmp, "hello.rs")
+            with open(filenpa_rs, "w") as f:
+                f.write("fn main(){}\n")
+            subprocess.run(["rustc", "-g", "-C", "link-arg=-Wl,--build-id", "-o", os.path.join(direpa_bin, "hello-rs"), filenpa_rs], check=True)
+
+        binaries=sorted(os.listdir(direpa_bin))
+        expected:dict[str, str|None]=dict()
+        for filen in binaries:
+            expected[filen]=get_elf_info(os.path.join(direpa_bin, filen))
+
+        start=time.perf_counter()
+        installed_size, build_ids=generate_md5sums(direpa_pkg, direpa_dbgsym)
+        msg.info(f"Stripped {', '.join(binaries)} in {(time.perf_counter()-start)*1000:.1f}ms")
+
+        for filen, build_id in expected.items():
+            if not build_id:
+                errors.append(f"{filen}: no GNU build-id found")
+                continue
+            filenpa_debug=os.path.join(direpa_dbgsym, "usr", "lib", "debug", ".build-id", build_id[:2], build_id[2:]+".debug")
+            if os.path.exists(filenpa_debug) is False:
+                errors.append(f"{filen}: debug file missing at '{filenpa_debug}'")
+            if build_id not in build_ids:
+                errors.append(f"{filen}: build-id {build_id} missing from {build_ids}")
+            if get_elf_info(os.path.join(direpa_bin, filen)) is not None:
+                errors.append(f"{filen}: still has debug sections")
+
+    if len(errors) > 0:
+        raise Exception("Strip regression:\n"+"\n".join(errors))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict
+from datetime import datetime
+import json
+import logging
+import logging.handlers
+import os
+import subprocess
+import threading
+import time
+
+from .models import ComponentLog
+
+from ..gpkgs import message as msg
+from ..gpkgs import shell_helpers as shell
+
+TAIL_LINES=60
+LOG_MAX_BYTES=20*1024*1024
+LOG_BACKUP_COUNT=3
+
+# the component log of the current thread, run() streams command output to it.
+current_log:ContextVar[ComponentLog|None]=ContextVar("current_log", default=None)
+index_lock=threading.Lock()
+
+def create_logs_dir(direpa_builds:str):
+    direpa_logs=os.path.join(direpa_builds, "logs", datetime.now().strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(direpa_logs, exist_ok=True)
+    return direpa_logs
+
+def write_index(direpa_logs:str, log:ComponentLog):
+    # index.json lists every component log of the build with its status and duration.
+    filenpa_index=os.path.join(direpa_logs, "index.json")
+    with index_lock:
+        index=dict()
+        if os.path.exists(filenpa_index):
+            with open(filenpa_index, "r") as f:
+                index=json.load(f)
+        index[log.name]=asdict(log)
+        with open(filenpa_index, "w") as f:
+            f.write(json.dumps(index, indent=4, sort_keys=True)+"\n")
+
+@contextmanager
+def component_log(direpa_logs:str, name:str):
+    filenpa=os.path.join(direpa_logs, f"{name}.log")
+    handler=logging.handlers.RotatingFileHandler(filenpa, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(stream)s %(message)s"))
+    logger=logging.getLogger(f"podman2deb.build.{name}")
+    logger.setLevel(logging.INFO)
+    logger.propagate=False
+    logger.addHandler(handler)
+
+    log=ComponentLog(name=name, filenpa=filenpa, start=time.time())
+    write_index(direpa_logs, log)
+    msg.info(f"Log for '{name}' at '{filenpa}'")
+    token=current_log.set(log)
+    try:
+        yield log
+        log.status="success"
+    except BaseException:
+        log.status="failed"
+        raise
+    finally:
+        log.duration=round(time.time()-log.start, 3)
+        current_log.reset(token)
+        logger.removeHandler(handler)
+        handler.close()
+        write_index(direpa_logs, log)
+
+def run(cmd:list[str], check:bool=True):
+    # Without a component log the command is streamed to the terminal as before.
+    # Otherwise stdout and stderr go to the component log file and only the tail is kept in memory.
+    # returns (returncode, tail lines)
+    log=current_log.get()
+    if log is None:
+        shell.cmd_prompt(cmd)
+        return (0, [])
+
+    logger=logging.getLogger(f"podman2deb.build.{log.name}")
+    logger.info(f"$ {' '.join(cmd)}", extra=dict(stream="cmd"))
+    proc=subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    tail:deque=deque(maxlen=TAIL_LINES)
+    tail_lock=threading.Lock()
+
+    def read(pipe, stream:str):
+        for raw in iter(pipe.readline, b""):
+            line=raw.decode(errors="replace").rstrip("\n")
+            logger.info(line, extra=dict(stream=stream))
+            with tail_lock:
+                tail.append(line)
+        pipe.close()
+
+    readers=[
+        threading.Thread(target=read, args=(proc.stdout, "out")),
+        threading.Thread(target=read, args=(proc.stderr, "err")),
+    ]
+    for reader in readers:
+        reader.start()
+    returncode=proc.wait()
+    for reader in readers:
+        reader.join()
+
+    if check is True and returncode != 0:
+        text_tail="\n".join(tail)
+        raise Exception(f"'{' '.join(cmd)}' failed with exit code {returncode}, full log at '{log.filenpa}':\n{text_tail}")
+    return (returncode, list(tail))
@@ -4,50 +4,103 @@ import os
 from re import sub
 import sys
 import subprocess
-import requests
 import shutil
-import tarfile
 import tempfile
 
 from .models import Debinfo, Repo
+from .buildlog import run
 
 from ..gpkgs.sudo.dev.sudo import Sudo
 from ..gpkgs import message as msg
 from ..gpkgs import shell_helpers as shell
 
-@contextmanager
-def setup_go(
-    repo:Repo,
-    direpa_assets:str,
-):
-    filengo=f"{repo.tag}.linux-amd64.tar.gz"
-    file_url=f"{repo.download}/{filengo}"
-    filenpa_go=os.path.join(direpa_assets, filengo)
-    if os.path.exists(filenpa_go) is False:
+# set by set_offline() so that downloads fail fast instead of reaching the network.
+OFFLINE_ENV="PODMAN2DEB_OFFLINE"
+
+def is_offline():
+    return os.environ.get(OFFLINE_ENV) == "1"
+
+def set_offline():
+    os.environ[OFFLINE_ENV]="1"
+    os.environ["GOPROXY"]="off"
+    os.environ["GOTOOLCHAIN"]="local"
+    os.environ["GOSUMDB"]="off"
+    os.environ["GOFLAGS"]="-mod=readonly"
+    os.environ["CARGO_NET_OFFLINE"]="true"
+
+def set_goflags(direpa_repo:str):
+    # offline go builds use the vendor folder when the repo has one and the prefetched module cache otherwise.
+    if is_offline():
+        if os.path.exists(os.path.join(direpa_repo, "vendor")):
+            os.environ["GOFLAGS"]="-mod=vendor"
+        else:
+            os.environ["GOFLAGS"]="-mod=readonly"
+
+def get_go_mod_dirs(direpa_repo:str):
+    # folders whose go modules must be in the module cache for an offline build, none when the repo is vendored.
+    if os.path.exists(os.path.join(direpa_repo, "vendor")):
+        return []
+    direpas:list[str]=[]
+    for rel in [".", "tools", os.path.join("test", "tools")]:
+        direpa=os.path.normpath(os.path.join(direpa_repo, rel))
+        if os.path.exists(os.path.join(direpa, "go.mod")):
+            direpas.append(direpa)
+    return direpas
+
+def download(file_url:str, filenpa:str):
+    # written to a .tmp file first so that an interrupted download is never taken as cached.
+    import requests
+
+    if os.path.exists(filenpa) is False:
+        if is_offline():
+            raise Exception(f"Offline build, '{filenpa}' is not cached, run --prefetch first.")
+        filenpa_tmp=filenpa+".tmp"
         try:
             response = requests.get(file_url, stream=True)
-            response.raise_for_status()
-            with open(filenpa_go, 'wb') as f:
+            response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
+            with open(filenpa_tmp, 'wb') as f:
                 for chunk in response.iter_content(chunk_size=8192):
                     if chunk:
                         f.write(chunk)
-            print(f"File '{filenpa_go}' downloaded successfully.")
         except requests.exceptions.RequestException as e:
-            print(f"Error during download: {e}")
+            if os.path.exists(filenpa_tmp):
+                os.remove(filenpa_tmp)
+            raise Exception(f"Error during download of '{file_url}': {e}")
+        os.replace(filenpa_tmp, filenpa)
+        print(f"File '{filenpa}' downloaded successfully.")
+    return filenpa
+
+def get_go(
+    repo:Repo,
+    direpa_assets:str,
+):
+    import tarfile
 
-    direpa_go=os.path.join(direpa_assets, "go")
-    if os.path.exists(direpa_go) is False:
+    filengo=f"{repo.tag}.linux-amd64.tar.gz"
+    file_url=f"{repo.download}/{filengo}"
+    filenpa_go=download(file_url, os.path.join(direpa_assets, filengo))
+
+    # one folder per go version so that the go used always matches repo.tag.
+    direpa_go_tag=os.path.join(direpa_assets, f"go-{repo.tag}")
+    if os.path.exists(direpa_go_tag) is False:
+        direpa_tmp=direpa_go_tag+".tmp"
+        if os.path.exists(direpa_tmp):
+            shutil.rmtree(direpa_tmp)
         try:
             with tarfile.open(filenpa_go, 'r:gz') as tar_file:
-                tar_file.extractall(path=direpa_assets)
-            print(f"Successfully extracted '{filenpa_go}' to '{direpa_assets}'")
+                tar_file.extractall(path=direpa_tmp)
         except tarfile.ReadError:
-            print(f"Error: Could not open or read '{filenpa_go}'. It might be corrupted or not a valid tar.gz file.")
-        except FileNotFoundError:
-            print(f"Error: Archive file not found at '{filenpa_go}'.")
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
-    direpa_go_bin=os.path.join(direpa_go, "bin")
+            raise Exception(f"Error: Could not open or read '{filenpa_go}'. It might be corrupted or not a valid tar.gz file.")
+        os.replace(direpa_tmp, direpa_go_tag)
+        print(f"Successfully extracted '{filenpa_go}' to '{direpa_go_tag}'")
+    return os.path.join(direpa_go_tag, "go", "bin")
+
+@contextmanager
+def setup_go(
+    repo:Repo,
+    direpa_assets:str,
+):
+    direpa_go_bin=get_go(repo, direpa_assets)
     allpaths=os.environ["PATH"].split(":")
     if direpa_go_bin not in allpaths:
         os.environ["PATH"]=f'{direpa_go_bin}:{os.environ["PATH"]}'
@@ -57,6 +110,7 @@ def setup_go(
     filenpa_bin_go=os.path.join(direpa_go_bin, "go")
     try:
         os.environ["GOCACHE"]=tmppath.name
+        os.environ["GOMODCACHE"]=os.path.join(direpa_assets, "gomodcache")
         os.environ["GO"]=filenpa_bin_go
         yield 
     finally:
@@ -83,23 +137,21 @@ def install_conmon(
         msg.info(f"At path {conmon_repo.path}")
         os.chdir(conmon_repo.path)
         checkout(conmon_repo)
+        set_goflags(conmon_repo.path)
         if clean is True:
-            shell.cmd_prompt(["make", "clean"])
-        shell.cmd_prompt(["make"])
+            run(["make", "clean"])
+        run(["make"])
         if os.path.exists(os.path.join(conmon_repo.path, "tools")):
-            stdout, stderr=subprocess.Popen(["make", "install.tools"], stderr=subprocess.PIPE).communicate()
-            if stderr is not None:
-                stderr=stderr.decode().strip()
-                if len(stderr) > 0:
-                    if "No rule to make target 'install.tools'" not in stderr:
-                        if "Nothing to be done for 'all'" not in stderr:
-                            raise Exception(stderr)
+            returncode, tail=run(["make", "install.tools"], check=False)
+            if returncode != 0:
+                if "No rule to make target 'install.tools'" not in "\n".join(tail):
+                    raise Exception("\n".join(tail))
         sudo.enable()
-        shell.cmd_prompt(["sudo", "-E", "make", "podman"])
+        run(["sudo", "-E", "make", "podman"])
         md2man=shutil.which("go-md2man")
         assert(md2man is not None)
         os.environ["GOMD2MAN"]=md2man
-        shell.cmd_prompt(["sudo", "-E", "make", "install"])
+        run(["sudo", "-E", "make", "install"])
 
 def install_passt(
     repo:Repo,
@@ -114,10 +166,10 @@ def install_passt(
     os.chdir(repo.path)
     checkout(repo)
     if clean is True:
-        shell.cmd_prompt(["make", "clean"])
-    shell.cmd_prompt(["make"])
+        run(["make", "clean"])
+    run(["make"])
     sudo.enable()
-    shell.cmd_prompt(["sudo", "-E", "make", "install"])
+    run(["sudo", "-E", "make", "install"])
 
 def install_runc(
     go_repo:Repo,
@@ -134,11 +186,12 @@ def install_runc(
         msg.info(f"At path {runc_repo.path}")
         os.chdir(runc_repo.path)
         checkout(runc_repo)
+        set_goflags(runc_repo.path)
         if clean is True:
-            shell.cmd_prompt(["make", "clean"])
-        shell.cmd_prompt(["make", "BUILDTAGS=selinux apparmor seccomp"])
+            run(["make", "clean"])
+        run(["make", "BUILDTAGS=selinux apparmor seccomp"])
         sudo.enable()
-        shell.cmd_prompt(["sudo", "-E", "make", "install"])
+        run(["sudo", "-E", "make", "install"])
 
 def add_conf(
     repo: Repo,
@@ -171,21 +224,28 @@ def add_conf(
                         text_registries='\", \"'.join(info.registries)
                         g.write(f'unqualified-search-registries=["{text_registries}"]')
             sudo.enable()
-            shell.cmd_prompt(["sudo", "chown", "root:root", file_dst])
+            run(["sudo", "chown", "root:root", file_dst])
 
             with open(filenpa_conffiles, "a") as f:
                 f.write(f"/etc/containers/{filen_conf}\n")
 
-def set_rust(direpa_repo:str, rust_tag:str):
+def check_rust():
     if shutil.which("cargo") is None:
         raise Exception("""Rust needs to be installed on your system:
             curl --proto '=https' --tlsv1.2 -sSf https://sh.rustup.rs | sh
             . "$HOME/.cargo/env"
         """)
+
+def set_rust(direpa_repo:str, rust_tag:str):
+    check_rust()
+    if is_offline():
+        toolchains=shell.cmd_get_value(["rustup", "toolchain", "list"]) or ""
+        if not any(t.startswith(f"{rust_tag}-") for t in toolchains.splitlines()):
+            raise Exception(f"Offline build, rust toolchain '{rust_tag}' is not installed, run --prefetch first.")
     
     os.chdir(direpa_repo)
-    shell.cmd_prompt(["rustup", "override", "set", rust_tag])
-    shell.cmd_prompt(["rustc", "--version"])
+    run(["rustup", "override", "set", rust_tag])
+    run(["rustc", "--version"])
 
 def install_mandown(
     repo:Repo,
@@ -199,10 +259,10 @@ def install_mandown(
     os.chdir(repo.path)
     checkout(repo)
     if clean is True:
-        subprocess.Popen(["make", "clean"]).communicate()
-    shell.cmd_prompt(["make"])
+        run(["make", "clean"], check=False)
+    run(["make"])
     filenpa_mdn=os.path.join(repo.path, "mdn")
-    shell.cmd_prompt(["chmod", "+x", filenpa_mdn])
+    run(["chmod", "+x", filenpa_mdn])
     return filenpa_mdn
 
 def install_netavark(
@@ -222,11 +282,11 @@ def install_netavark(
     os.chdir(repo.path)
     checkout(repo)
     if clean is True:
-        shell.cmd_prompt(["make", "clean"])
-    shell.cmd_prompt(["make"])
-    shell.cmd_prompt(["make", "docs"])
+        run(["make", "clean"])
+    run(["make"])
+    run(["make", "docs"])
     sudo.enable()
-    shell.cmd_prompt(["sudo", "-E", "make", "install"])
+    run(["sudo", "-E", "make", "install"])
 
 def install_aardvark_dns(
     repo:Repo,
@@ -246,10 +306,19 @@ def install_aardvark_dns(
     checkout(repo)
 
     if clean is True:
-        subprocess.Popen(["make", "clean"]).communicate()
-    shell.cmd_prompt(["make"])
+        run(["make", "clean"], check=False)
+    run(["make"])
     sudo.enable()
-    shell.cmd_prompt(["sudo", "-E", "make", "install"])
+    run(["sudo", "-E", "make", "install"])
+
+def download_slirp4netns(
+    repo:Repo,
+    direpa_assets:str,
+):
+    arch=shell.cmd_get_value(["uname", "-m"])
+    filenbin=f"{repo.name}-{arch}"
+    file_url=f"{repo.giturl}/releases/download/{repo.tag}/{filenbin}"
+    return download(file_url, os.path.join(direpa_assets, filenbin+f"-{repo.tag}"))
 
 def install_slirp4netns(
     repo:Repo,
@@ -258,29 +327,15 @@ def install_slirp4netns(
     sudo:Sudo,
 ):
     title(repo.name)
-    arch=shell.cmd_get_value(["uname", "-m"])
-    filenbin=f"{repo.name}-{arch}"
-    file_url=f"{repo.giturl}/releases/download/{repo.tag}/{filenbin}"
-    filenpa_bin=os.path.join(direpa_assets, filenbin+f"-{repo.tag}")
-    if os.path.exists(filenpa_bin) is False:
-        try:
-            response = requests.get(file_url, stream=True)
-            response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
-            with open(filenpa_bin, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-            print(f"File '{filenpa_bin}' downloaded successfully.")
-        except requests.exceptions.RequestException as e:
-            print(f"Error during download: {e}")
+    filenpa_bin=download_slirp4netns(repo, direpa_assets)
 
     direpa_dst=os.path.join(direpa_pkg, "usr", "bin")
     sudo.enable()
-    shell.cmd_prompt(["sudo", "mkdir", "-p", direpa_dst])
+    run(["sudo", "mkdir", "-p", direpa_dst])
     filenpa_dst=os.path.join(direpa_dst, repo.name)
-    shell.cmd_prompt(["sudo", "cp", filenpa_bin, filenpa_dst])
-    shell.cmd_prompt(["sudo", "chown", "root:root", filenpa_dst])
-    shell.cmd_prompt(["sudo", "chmod", "+x", filenpa_dst])
+    run(["sudo", "cp", filenpa_bin, filenpa_dst])
+    run(["sudo", "chown", "root:root", filenpa_dst])
+    run(["sudo", "chmod", "+x", filenpa_dst])
 
 def install_podman(
     go_repo:Repo,
@@ -297,11 +352,12 @@ def install_podman(
         msg.info(f"At path {podman_repo.path}")
         os.chdir(podman_repo.path)
         checkout(podman_repo)
+        set_goflags(podman_repo.path)
         if clean is True:
-            shell.cmd_prompt(["make", "clean"])
-        shell.cmd_prompt(["make", "BUILDTAGS=exclude_graphdriver_devicemapper apparmor selinux seccomp systemd"])
+            run(["make", "clean"])
+        run(["make", "BUILDTAGS=exclude_graphdriver_devicemapper apparmor selinux seccomp systemd"])
         sudo.enable()
-        shell.cmd_prompt(["sudo", "-E", "make", "install"])
+        run(["sudo", "-E", "make", "install"])
 
 def checkout(repo:Repo):
     stdout, stderr=subprocess.Popen(["git", "describe", "--exact-match", "--tags"], stdout=subprocess.PIPE, stderr=subprocess.PIPE).communicate()
@@ -309,5 +365,5 @@ def checkout(repo:Repo):
     if stdout is not None:
         current_tag=stdout.decode().strip()
     if current_tag != repo.tag:
-        shell.cmd_prompt(["git", "clean", "-fd"])
-        shell.cmd_prompt(["git", "checkout", repo.tag])
\ No newline at end of file
+        run(["git", "clean", "-fd"])
+        run(["git", "checkout", repo.tag])
\ No newline at end of file
@@ -55,4 +55,12 @@ class Repo:
     date: datetime|None=None
     download: str|None=None
     prefix: str=""
+    mirror: str|None=None
 
+@dataclass
+class ComponentLog:
+    name: str
+    filenpa: str
+    start: float
+    status: str="running"
+    duration: float|None=None
@@ -1,42 +1,64 @@
 #!/usr/bin/env python3
 from pprint import pprint
 import hashlib
-import requests
-import tarfile
 import json
 import os
 import sys
 from datetime import datetime
 import subprocess
-import tempfile
 import shutil
 from dataclasses import asdict
-import platform
-from contextlib import contextmanager
-
-from src.gpkgs.semver.dev.semver import NotSemanticVersion
-
-
-from .install_deps import add_conf, install_aardvark_dns, install_conmon, install_mandown, install_netavark, install_passt, install_podman, install_runc, install_slirp4netns, setup_go
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+import time
+import typing
 
 from ..dev.models import Debinfo, RepoName as er, Repo, Repos
 
 from ..gpkgs.sudo import Sudo
 from ..gpkgs import message as msg
 from ..gpkgs import shell_helpers as shell
-from ..gpkgs.semver import SemVer, semver
+
+# build-only modules (install_deps, requests, tarfile) and semver are imported where they are used
+# so that read-only commands like --list-tags and --build-info start fast.
+
+@contextmanager
+def records_stream():
+    # yields a stream on the real stdout for NDJSON records, meanwhile fd 1 points to stderr so that
+    # progress of python and of child processes (git clone, fetch, submodules) does not mix with records.
+    sys.stdout.flush()
+    fd_stdout=os.dup(1)
+    os.dup2(2, 1)
+    stream=os.fdopen(fd_stdout, "w")
+    try:
+        with redirect_stdout(sys.stderr):
+            yield stream
+    finally:
+        stream.flush()
+        sys.stdout.flush()
+        os.dup2(fd_stdout, 1)
+        stream.close()
+
+def emit_record(stream:typing.TextIO, record:dict):
+    # one JSON object per line (NDJSON), flushed so consumers get it right away.
+    stream.write(json.dumps(record, sort_keys=True, default=str)+"\n")
+    stream.flush()
 
 def get_repos(
     info:Debinfo,
     direpa_sources:str,
     podman_tag:str|None=None,
+    on_resolved:typing.Callable[[Repo, float], None]|None=None,
+    offline:bool=False,
 ):
+    # on_resolved(repo, duration) is called as soon as each repo tag is resolved.
     drs:dict[er, Repo]=dict()
     for repo in info.repos:
         drs[repo.name]=repo
-        set_repo(direpa_sources, repo, update=False)
+        set_repo(direpa_sources, repo, update=False, offline=offline)
 
     repos=Repos(**drs)
+    start=time.perf_counter()
     if podman_tag is None:
         repos.podman.tag=get_latest_tag(repos.podman)
     else:    
@@ -48,46 +70,296 @@ def get_repos(
 
     commit_time=get_commit_time(repos.podman, repos.podman.tag)
     repos.podman.date=commit_time
-    repos.runc.tag=get_closest_tag(repos.runc, commit_time, trigger_error=False)
-    repos.conmon.tag=get_closest_tag(repos.conmon, commit_time, trigger_error=False)
-    repos.passt.tag=get_closest_tag(repos.passt, commit_time, trigger_error=False)
-    repos.netavark.tag=get_closest_tag(repos.netavark, commit_time, trigger_error=False)
-    repos.aardvark_dns.tag=get_closest_tag(repos.aardvark_dns, commit_time, trigger_error=False)
-    repos.go.tag=get_closest_tag(repos.go, commit_time, trigger_error=True)
-    repos.image.tag=get_closest_tag(repos.image, commit_time, trigger_error=False)
-    repos.slirp4netns.tag=get_closest_tag(repos.slirp4netns, commit_time, trigger_error=False)
-    repos.rust.tag=get_closest_tag(repos.rust, commit_time, trigger_error=True)
-    repos.mandown.tag=get_closest_tag(repos.mandown, commit_time, trigger_error=False)
-
+    if on_resolved is not None:
+        on_resolved(repos.podman, time.perf_counter()-start)
+
+    for repo, trigger_error in [
+        (repos.runc, False),
+        (repos.conmon, False),
+        (repos.passt, False),
+        (repos.netavark, False),
+        (repos.aardvark_dns, False),
+        (repos.go, True),
+        (repos.image, False),
+        (repos.slirp4netns, False),
+        (repos.rust, True),
+        (repos.mandown, False),
+    ]:
+        start=time.perf_counter()
+        repo.tag=get_closest_tag(repo, commit_time, trigger_error=trigger_error)
+        if on_resolved is not None:
+            on_resolved(repo, time.perf_counter()-start)
+
+    return (repos, dump_repos(repos))
+
+def dump_repos(repos:Repos):
     print_obj=dict()
-    for key, value in drs.items():
+    for key, value in vars(repos).items():
         print_obj[key]=asdict(value)
-    dump=json.dumps(print_obj, indent=4, sort_keys=True, default=str)
-    return (repos, dump)
+        # the mirror is a local path of this builder, not part of the resolved repo.
+        del print_obj[key]["mirror"]
+    return json.dumps(print_obj, indent=4, sort_keys=True, default=str)
+
+def get_commit(repo:Repo, tag:str):
+    assert(repo.path is not None)
+    output=shell.cmd_get_value(["git", "-C", repo.path, "rev-parse", f"{tag}^{{commit}}"])
+    assert(isinstance(output, str))
+    return output
+
+def get_toolchains(
+    repos:Repos,
+    direpa_assets:str,
+):
+    # versions reported by the toolchains that end up in the binaries, gcc comes from the system.
+    from .install_deps import get_go, check_rust
+
+    assert(repos.rust.tag is not None)
+    filenpa_go=os.path.join(get_go(repos.go, direpa_assets), "go")
+    check_rust()
+    return dict(
+        go=shell.cmd_get_value([filenpa_go, "version"]),
+        rust=shell.cmd_get_value(["rustc", f"+{repos.rust.tag}", "--version"]),
+        gcc=shell.cmd_get_value(["gcc", "-dumpfullversion"]),
+    )
+
+def lock(
+    info:Debinfo,
+    direpa_sources:str,
+    direpa_assets:str,
+    filenpa_lock:str,
+    podman_tag:str|None=None,
+):
+    os.makedirs(direpa_sources, exist_ok=True)
+    os.makedirs(direpa_assets, exist_ok=True)
+    repos, dump=get_repos(
+        info=info,
+        direpa_sources=direpa_sources,
+        podman_tag=podman_tag,
+    )
+    assert(repos.rust.tag is not None)
+    shell.cmd_prompt(["rustup", "toolchain", "install", "--profile", "minimal", repos.rust.tag])
+    data=dict(
+        version=info.version,
+        toolchains=get_toolchains(repos, direpa_assets),
+        repos=dict(),
+    )
+    for key, repo in sorted(vars(repos).items()):
+        data["repos"][key]=dict(
+            tag=repo.tag,
+            commit=None if repo.tag is None else get_commit(repo, repo.tag),
+            date=repo.date,
+            giturl=repo.giturl,
+        )
+    with open(filenpa_lock, "w") as f:
+        f.write(json.dumps(data, indent=4, sort_keys=True, default=str)+"\n")
+    msg.info(f"Lockfile written at '{filenpa_lock}'")
+
+def get_locked_repos(
+    info:Debinfo,
+    direpa_sources:str,
+    direpa_assets:str,
+    filenpa_lock:str,
+    podman_tag:str|None=None,
+    offline:bool=False,
+):
+    # same as get_repos but tags come from the lockfile and their commits are checked.
+    with open(filenpa_lock, "r") as f:
+        data=json.load(f)
+
+    if podman_tag is not None and podman_tag != data["repos"][er.PODMAN]["tag"]:
+        raise Exception(f"Tag '{podman_tag}' differs from podman tag '{data['repos'][er.PODMAN]['tag']}' in lockfile '{filenpa_lock}', run --lock --tag {podman_tag} first.")
+
+    drs:dict[er, Repo]=dict()
+    for repo in info.repos:
+        drs[repo.name]=repo
+        set_repo(direpa_sources, repo, update=False, offline=offline)
+        if repo.name not in data["repos"]:
+            raise Exception(f"Repo '{repo.name}' is missing from lockfile '{filenpa_lock}'")
+        dy=data["repos"][repo.name]
+        repo.tag=dy["tag"]
+        if repo.tag is not None:
+            commit=get_commit(repo, repo.tag)
+            if commit != dy["commit"]:
+                raise Exception(f"Repo '{repo.name}' tag '{repo.tag}' is at commit '{commit}' but lockfile '{filenpa_lock}' has '{dy['commit']}'")
+            repo.date=get_commit_time(repo, repo.tag)
+
+    repos=Repos(**drs)
+    toolchains=get_toolchains(repos, direpa_assets)
+    if toolchains != data["toolchains"]:
+        raise Exception(f"Toolchains {toolchains} differ from lockfile '{filenpa_lock}' {data['toolchains']}")
+    info.version=data["version"]
+    return (repos, dump_repos(repos))
+
+def publish_deb(
+    direpa:str,
+    filenpa_deb:str,
+    epoch:int,
+):
+    # deterministic archive: every mtime is set to SOURCE_DATE_EPOCH, owners are root and dpkg-deb sorts entries.
+    # When the new deb is byte-identical to the existing one, the existing file is kept untouched.
+    shell.cmd_prompt(["sudo", "find", os.path.join(direpa, "DEBIAN"), "-type", "f", "-exec", "chmod", "0644", "{}", "+"])
+    shell.cmd_prompt(["sudo", "find", direpa, "-exec", "touch", "--no-dereference", f"--date=@{epoch}", "{}", "+"])
+    filenpa_tmp=filenpa_deb+".tmp"
+    shell.cmd_prompt(["dpkg-deb", "--root-owner-group", "-b", direpa, filenpa_tmp])
+    with open(filenpa_tmp, "rb") as f:
+        digest=hashlib.sha256(f.read()).hexdigest()
+    filenpa_sha256=filenpa_deb+".sha256"
+    if os.path.exists(filenpa_deb) and os.path.exists(filenpa_sha256):
+        with open(filenpa_sha256, "r") as f:
+            if f.read().split(" ")[0] == digest:
+                os.remove(filenpa_tmp)
+                msg.info(f"'{filenpa_deb}' is unchanged ({digest})")
+                return False
+    os.replace(filenpa_tmp, filenpa_deb)
+    with open(filenpa_sha256, "w") as f:
+        f.write(f"{digest}  {os.path.basename(filenpa_deb)}\n")
+    msg.info(f"'{filenpa_deb}' built ({digest})")
+    return True
+
+# repos whose Makefile calls the go toolchain
+GO_REPOS=[er.PODMAN, er.RUNC, er.CONMON, er.IMAGE]
+
+def get_cached_go(direpa_assets:str):
+    # any go already extracted by get_go in assets/go-<tag>, the newest one first.
+    for filen in sorted(os.listdir(direpa_assets), key=lambda f: os.path.getmtime(os.path.join(direpa_assets, f)), reverse=True):
+        filenpa_go=os.path.join(direpa_assets, filen, "go", "bin", "go")
+        if filen.startswith("go-") and os.path.exists(filenpa_go):
+            return filenpa_go
+    return None
+
+# build outputs of each repo relative to its root, --stale never removes other ignored files.
+BUILD_OUTPUTS:dict[str, list[str]]={
+    er.PODMAN: ["bin", "build", "docs/build"],
+    er.RUNC: ["runc"],
+    er.CONMON: ["bin"],
+    er.PASST: ["passt", "pasta", "qrap", "passt.avx2", "pasta.avx2", "passt-repair"],
+    er.NETAVARK: ["bin", "targets", "target"],
+    er.AARDVARK_DNS: ["bin", "targets", "target"],
+    er.MANDOWN: ["mdn"],
+}
+# object files are build outputs in any repo, they are compared to their own C source when it exists.
+OBJECT_EXTENSIONS=[".o", ".a", ".so"]
+SOURCE_EXTENSIONS=[".c", ".h", ".go", ".rs", ".mod", ".sum", ".toml", ".lock", ".mk"]
+
+def get_stale_artifacts(repo:Repo, direpa_repo:str):
+    # ignored build outputs that are older than the sources they are built from.
+    output=subprocess.run(["git", "ls-files", "-z"], cwd=direpa_repo, stdout=subprocess.PIPE, check=True).stdout
+    mtimes:dict[str, float]=dict()
+    for filen in output.decode().split("\0"):
+        filenpa=os.path.join(direpa_repo, filen)
+        if os.path.splitext(filen)[1] in SOURCE_EXTENSIONS or os.path.basename(filen) == "Makefile":
+            if os.path.lexists(filenpa):
+                mtimes[filen]=os.lstat(filenpa).st_mtime
+    newest_source=max(mtimes.values(), default=0.0)
+    newest_header=max([m for f, m in mtimes.items() if f.endswith(".h")], default=0.0)
+
+    outputs=BUILD_OUTPUTS.get(repo.name, [])
+    output=subprocess.run(["git", "ls-files", "-z", "--others", "--ignored", "--exclude-standard"], cwd=direpa_repo, stdout=subprocess.PIPE, check=True).stdout
+    filenpas:list[str]=[]
+    for filen in output.decode().split("\0"):
+        filenpa=os.path.join(direpa_repo, filen)
+        if filen == "" or os.path.lexists(filenpa) is False:
+            continue
+        base, ext=os.path.splitext(filen)
+        if ext in OBJECT_EXTENSIONS and f"{base}.c" in mtimes:
+            # i.e. src/conmon.o is stale when src/conmon.c or any header changed.
+            source_mtime=max(mtimes[f"{base}.c"], newest_header)
+        elif ext in OBJECT_EXTENSIONS or any(filen == o or filen.startswith(f"{o}/") for o in outputs):
+            source_mtime=newest_source
+        else:
+            continue
+        if os.lstat(filenpa).st_mtime < source_mtime:
+            filenpas.append(filenpa)
+    return filenpas
+
+def clean_repo(
+    repo:Repo,
+    direpa_repo:str,
+    filenpa_go:str|None,
+    stale:bool=False,
+):
+    start=time.perf_counter()
+    if stale is True:
+        filenpas=get_stale_artifacts(repo, direpa_repo)
+        failed:list[str]=[]
+        for filenpa in filenpas:
+            try:
+                if os.path.isdir(filenpa) and not os.path.islink(filenpa):
+                    shutil.rmtree(filenpa)
+                else:
+                    os.remove(filenpa)
+            except OSError as e:
+                # i.e. root owned artifacts left by 'sudo -E make install'
+                failed.append(f"{filenpa}: {e.strerror}")
+        if len(failed) > 0:
+            raise Exception(f"could not remove {len(failed)} of {len(filenpas)} stale artifacts:\n"+"\n".join(failed))
+        return f"removed {len(filenpas)} stale artifacts in {time.perf_counter()-start:.1f}s"
+
+    if repo.name in GO_REPOS and filenpa_go is None:
+        # no cached toolchain, remove ignored files with git instead of downloading go to run make clean.
+        cmd=["git", "clean", "-fdX"]
+    else:
+        cmd=["make", "clean"]
+    env=os.environ.copy()
+    if filenpa_go is not None:
+        env["PATH"]=f'{os.path.dirname(filenpa_go)}:{env["PATH"]}'
+        env["GO"]=filenpa_go
+    proc=subprocess.run(cmd, cwd=direpa_repo, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if proc.returncode != 0:
+        raise Exception(f"'{' '.join(cmd)}' failed at '{direpa_repo}':\n{proc.stdout.decode()}")
+    return f"'{' '.join(cmd)}' done in {time.perf_counter()-start:.1f}s"
 
 def clean(
     direpa_sources:str,
     direpa_assets:str,
     direpa_pkg:str,
+    direpa_dbgsym:str,
     info:Debinfo,
     sudo:Sudo,
+    components:list[str]|None=None,
+    stale:bool=False,
+    jobs:int|None=None,
 ):
+    # components are repo names, all repos are cleaned when None.
+    # stale=True only removes the build outputs (BUILD_OUTPUTS and object files) older than their sources instead of running make clean.
+    repos=info.repos
+    if components is not None:
+        names=[r.name for r in info.repos]
+        for component in components:
+            if component not in names:
+                raise Exception(f"Unknown component '{component}', select from: {', '.join(names)}")
+        repos=[r for r in info.repos if r.name in components]
+
     sudo.enable()
-    if os.path.exists(direpa_pkg):
-        shell.cmd_prompt(["sudo", "rm", "-r", direpa_pkg])
-
-    go_repo=[r for r in info.repos if r.name == er.GO][0]
-    go_repo.path=os.path.join(direpa_sources, er.GO)
-    go_repo.tag=get_latest_tag(go_repo)
-
-    with setup_go(go_repo, direpa_assets):
-        for repo in info.repos:
-            direpa_repo=os.path.join(direpa_sources, repo.name)
-            if os.path.exists(direpa_repo) is True:
-                msg.info(f"At path '{direpa_repo}'")
-                if os.path.exists(os.path.join(direpa_repo, "Makefile")):
-                    os.chdir(direpa_repo)
-                    stdout, stderr=subprocess.Popen(["make", "clean"]).communicate()
+    for direpa in [direpa_pkg, direpa_dbgsym]:
+        if os.path.exists(direpa):
+            shell.cmd_prompt(["sudo", "rm", "-r", direpa])
+
+    filenpa_go=get_cached_go(direpa_assets)
+    if filenpa_go is None:
+        msg.info(f"No cached go toolchain at '{direpa_assets}', go repos are cleaned with 'git clean -fdX'")
+
+    selected:list[tuple[Repo, str]]=[]
+    for repo in repos:
+        direpa_repo=os.path.join(direpa_sources, repo.name)
+        if os.path.exists(os.path.join(direpa_repo, "Makefile")):
+            selected.append((repo, direpa_repo))
+
+    if len(selected) == 0:
+        return
+
+    with ThreadPoolExecutor(max_workers=jobs or min(len(selected), os.cpu_count() or 1)) as executor:
+        futures=[(repo, direpa_repo, executor.submit(clean_repo, repo, direpa_repo, filenpa_go, stale)) for repo, direpa_repo in selected]
+        errors:list[str]=[]
+        for repo, direpa_repo, future in futures:
+            try:
+                msg.info(f"At path '{direpa_repo}' {future.result()}")
+            except Exception as e:
+                msg.info(f"At path '{direpa_repo}' failed")
+                errors.append(f"{repo.name}: {e}")
+
+    if len(errors) > 0:
+        raise Exception(f"Clean failed for {len(errors)} of {len(selected)} repositories:\n"+"\n".join(errors))
 
 def update(
     direpa_sources:str,
@@ -96,39 +368,221 @@ def update(
     for repo in info.repos:
         set_repo(direpa_sources, repo, update=True)
 
-def build_info(
+def prefetch_go(
+    repos:Repos,
+    direpa_assets:str,
+):
+    from .install_deps import get_go, get_go_mod_dirs
+
+    filenpa_go=os.path.join(get_go(repos.go, direpa_assets), "go")
+    env=os.environ.copy()
+    env["GOMODCACHE"]=os.path.join(direpa_assets, "gomodcache")
+    env["GOTOOLCHAIN"]="local"
+    env["GOFLAGS"]="-mod=mod"
+    direpas:list[str]=[]
+    for repo in [repos.podman, repos.runc, repos.conmon]:
+        if repo.tag is not None:
+            assert(repo.path is not None)
+            direpas.extend(get_go_mod_dirs(repo.path))
+    for direpa in direpas:
+        subprocess.run([filenpa_go, "mod", "download"], cwd=direpa, env=env, check=True)
+    return f"go {repos.go.tag} and modules for {len(direpas)} folders"
+
+def prefetch_rust(
+    repos:Repos,
+):
+    from .install_deps import check_rust
+
+    check_rust()
+    assert(repos.rust.tag is not None)
+    subprocess.run(["rustup", "toolchain", "install", "--profile", "minimal", repos.rust.tag], check=True)
+    env=os.environ.copy()
+    env["RUSTUP_TOOLCHAIN"]=repos.rust.tag
+    fetched:list[str]=[]
+    if repos.mandown.tag is not None:
+        for repo in [repos.netavark, repos.aardvark_dns]:
+            if repo.tag is not None:
+                assert(repo.path is not None)
+                subprocess.run(["cargo", "fetch"], cwd=repo.path, env=env, check=True)
+                fetched.append(repo.name)
+    return f"rust {repos.rust.tag} and crates for {', '.join(fetched)}"
+
+def prefetch_slirp4netns(
+    repos:Repos,
+    direpa_assets:str,
+):
+    from .install_deps import download_slirp4netns
+
+    if repos.slirp4netns.tag is None:
+        return "no slirp4netns tag"
+    return download_slirp4netns(repos.slirp4netns, direpa_assets)
+
+def prefetch(
     info:Debinfo,
     direpa_sources:str,
+    direpa_assets:str,
     podman_tag:str|None=None,
 ):
+    # fill every cache that --build --offline needs: sources at their tag, go tarball and modules,
+    # rust toolchain and crates, slirp4netns binary.
+    from .install_deps import checkout
+
     os.makedirs(direpa_sources, exist_ok=True)
+    os.makedirs(direpa_assets, exist_ok=True)
     repos, dump=get_repos(
         info=info,
         direpa_sources=direpa_sources,
         podman_tag=podman_tag,
     )
-
     print(dump)
 
-def generate_md5sums(direpa_pkg):
+    # go modules and crates are resolved from the files at the selected tag.
+    for repo in [repos.podman, repos.runc, repos.conmon, repos.netavark, repos.aardvark_dns]:
+        if repo.tag is not None:
+            assert(repo.path is not None)
+            os.chdir(repo.path)
+            checkout(repo)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures=[
+            executor.submit(prefetch_go, repos, direpa_assets),
+            executor.submit(prefetch_rust, repos),
+            executor.submit(prefetch_slirp4netns, repos, direpa_assets),
+        ]
+        for future in futures:
+            msg.info(f"Prefetched {future.result()}")
+
+def build_info(
+    info:Debinfo,
+    direpa_sources:str,
+    podman_tag:str|None=None,
+    json_output:bool=False,
+):
+    os.makedirs(direpa_sources, exist_ok=True)
+    if json_output is False:
+        repos, dump=get_repos(
+            info=info,
+            direpa_sources=direpa_sources,
+            podman_tag=podman_tag,
+        )
+        print(dump)
+        return
+
+    with records_stream() as stream:
+        start=time.perf_counter()
+        def on_resolved(repo:Repo, duration:float):
+            record=asdict(repo)
+            del record["mirror"]
+            record["type"]="repo"
+            record["duration"]=round(duration, 6)
+            record["elapsed"]=round(time.perf_counter()-start, 6)
+            emit_record(stream, record)
+
+        get_repos(
+            info=info,
+            direpa_sources=direpa_sources,
+            podman_tag=podman_tag,
+            on_resolved=on_resolved,
+        )
+        emit_record(stream, dict(
+            type="build_info",
+            package=info.package,
+            version=info.version,
+            elapsed=round(time.perf_counter()-start, 6),
+        ))
+
+def get_elf_info(filenpa:str):
+    # returns None when file is not an ELF or has no debug sections, otherwise its GNU build-id or "" when missing.
+    with open(filenpa, "rb") as f:
+        if f.read(4) != b"\x7fELF":
+            return None
+    output=shell.cmd_get_value(["readelf", "--wide", "--notes", "--section-headers", filenpa])
+    if output is None:
+        return None
+    build_id:str|None=None
+    has_debug=False
+    for line in output.splitlines():
+        line=line.strip()
+        # GNU  0x00000014  NT_GNU_BUILD_ID (unique build ID bitstring)  Build ID: b68f56a8...
+        if "Build ID:" in line:
+            build_id=line.split("Build ID:", 1)[1].strip()
+        elif "] .debug_" in line or "] .zdebug_" in line:
+            # [28] .debug_info PROGBITS 0000000000000000 003067 000054 00 [Flg] 0 0 1
+            # allocated sections (flag A) such as rust .debug_gdb_scripts are loaded at runtime and kept by strip.
+            elems=line.split("]", 1)[1].split()
+            if len(elems) < 10 or "A" not in elems[6]:
+                has_debug=True
+    if has_debug is False:
+        return None
+    if build_id is None:
+        return ""
+    return build_id
+
+def strip_file(
+    filenpa:str,
+    direpa_pkg:str,
+    direpa_dbgsym:str,
+):
+    # Debug info goes to usr/lib/debug/.build-id/xx/yyyy.debug when a GNU build-id exists
+    # otherwise to usr/lib/debug/<path>.debug, both paths are searched by gdb.
+    build_id=get_elf_info(filenpa)
+    if build_id is None:
+        return None
+    if build_id == "":
+        short_path=os.path.relpath(filenpa, direpa_pkg)
+        filenpa_debug=os.path.join(direpa_dbgsym, "usr", "lib", "debug", short_path+".debug")
+    else:
+        filenpa_debug=os.path.join(direpa_dbgsym, "usr", "lib", "debug", ".build-id", build_id[:2], build_id[2:]+".debug")
+    subprocess.run(["sudo", "mkdir", "-p", os.path.dirname(filenpa_debug)], check=True)
+    subprocess.run(["sudo", "objcopy", "--only-keep-debug", "--compress-debug-sections", filenpa, filenpa_debug], check=True)
+    subprocess.run(["sudo", "chmod", "644", filenpa_debug], check=True)
+    subprocess.run(["sudo", "objcopy", "--strip-debug", "--strip-unneeded", "--remove-section=.comment", f"--add-gnu-debuglink={filenpa_debug}", filenpa], check=True)
+    return build_id
+
+def process_file(
+    filenpa_usr:str,
+    direpa_pkg:str,
+    direpa_dbgsym:str|None=None,
+):
+    build_id:str|None=None
+    if direpa_dbgsym is not None and not os.path.islink(filenpa_usr):
+        build_id=strip_file(filenpa_usr, direpa_pkg, direpa_dbgsym)
+    size=0
+    if not os.path.islink(filenpa_usr):
+        size=os.stat(filenpa_usr).st_blocks * 512
+    data_md5=hashlib.md5()
+    with open(filenpa_usr, 'rb') as file_to_check:
+        for chunk in iter(lambda: file_to_check.read(1024*1024), b""):
+            data_md5.update(chunk)
+    return (data_md5.hexdigest(), size, build_id)
+
+def generate_md5sums(
+    direpa_pkg:str,
+    direpa_dbgsym:str|None=None,
+):
     # md5sums
     # 99f31c0169430fae0c2a850a9ee9f1aa  usr/bin/podman
+    # when direpa_dbgsym is set ELF files are stripped first and their debug info is moved to direpa_dbgsym.
     filenpa_md5=os.path.join(direpa_pkg, "DEBIAN", "md5sums")
     direpa_usr=os.path.join(direpa_pkg, "usr")
+    filenpas:list[str]=[]
+    for root, dirs, files in os.walk(direpa_usr):
+        for elem in files:
+            filenpas.append(os.path.join(root, elem))
+    filenpas.sort(key=lambda filenpa: os.path.relpath(filenpa, direpa_pkg))
+
     total_size = 0
-    with open(filenpa_md5, "w") as f:
-        for root, dirs, files in os.walk(direpa_usr):
-            for elem in sorted(files):
-                filenpa_usr=os.path.join(root, elem)
-                if not os.path.islink(filenpa_usr):
-                    total_size += os.stat(filenpa_usr).st_blocks * 512;
+    build_ids:list[str]=[]
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results=executor.map(lambda filenpa: process_file(filenpa, direpa_pkg, direpa_dbgsym), filenpas)
+        with open(filenpa_md5, "w") as f:
+            for filenpa_usr, (data_md5, size, build_id) in zip(filenpas, results):
+                total_size += size
+                if build_id:
+                    build_ids.append(build_id)
                 short_path=os.path.relpath(filenpa_usr, direpa_pkg)
-                with open(filenpa_usr, 'rb') as file_to_check:
-                    data = file_to_check.read()
-                    data_md5 = hashlib.md5(data).hexdigest()
-                    f.write(f"{data_md5}  {short_path}\n")
-    return int(total_size / 1024)
-
+                f.write(f"{data_md5}  {short_path}\n")
+    return (int(total_size / 1024), sorted(build_ids))
 
 def build(
     info:Debinfo,
@@ -136,14 +590,25 @@ def build(
     direpa_assets:str,
     direpa_pkg:str,
     direpa_builds:str,
+    direpa_dbgsym:str,
     sudo:Sudo,
     podman_tag:str|None=None,
+    strip:bool=True,
+    offline:bool=False,
+    filenpa_lock:str|None=None,
     # update:bool=True,
     # clean:bool=True,
 ):
+    from .install_deps import add_conf, install_aardvark_dns, install_conmon, install_mandown, install_netavark, install_passt, install_podman, install_runc, install_slirp4netns, set_offline
+    from .buildlog import component_log, create_logs_dir
+
+    if offline is True:
+        set_offline()
+
     sudo.enable()
-    if os.path.exists(direpa_pkg):
-        shell.cmd_prompt(["sudo", "rm", "-r", direpa_pkg])
+    for direpa in [direpa_pkg, direpa_dbgsym]:
+        if os.path.exists(direpa):
+            shell.cmd_prompt(["sudo", "rm", "-r", direpa])
 
     subprocess.Popen(["mkdir", "-p", direpa_pkg]).communicate()
     filenpa_control=os.path.join(direpa_pkg, "DEBIAN", "control")
@@ -151,92 +616,123 @@ def build(
     subprocess.Popen(cmd).communicate()
   
     os.makedirs(direpa_sources, exist_ok=True)
-    repos, dump=get_repos(
-        info=info,
-        direpa_sources=direpa_sources,
-        podman_tag=podman_tag,
-    )
+    if filenpa_lock is None:
+        repos, dump=get_repos(
+            info=info,
+            direpa_sources=direpa_sources,
+            podman_tag=podman_tag,
+            offline=offline,
+        )
+    else:
+        repos, dump=get_locked_repos(
+            info=info,
+            direpa_sources=direpa_sources,
+            direpa_assets=direpa_assets,
+            filenpa_lock=filenpa_lock,
+            podman_tag=podman_tag,
+            offline=offline,
+        )
 
     print(dump)
-
-    add_conf(
-        repo=repos.image,
-        direpa_pkg=direpa_pkg,
-        sudo=sudo,
-        info=info,
-    )
+    assert(repos.podman.date is not None)
+    epoch=int(repos.podman.date.timestamp())
+    os.environ["SOURCE_DATE_EPOCH"]=str(epoch)
+
+    direpa_logs=create_logs_dir(direpa_builds)
+    with component_log(direpa_logs, repos.image.name):
+        add_conf(
+            repo=repos.image,
+            direpa_pkg=direpa_pkg,
+            sudo=sudo,
+            info=info,
+        )
 
 
     if repos.mandown.tag is not None:
-        filenpa_mandown=install_mandown(
-            repo=repos.mandown,
-            direpa_pkg=direpa_pkg,
-        )
+        with component_log(direpa_logs, repos.mandown.name):
+            filenpa_mandown=install_mandown(
+                repo=repos.mandown,
+                direpa_pkg=direpa_pkg,
+            )
         assert(repos.rust.tag is not None)
 
         if repos.netavark.tag is not None:
-            install_netavark(
-                repo=repos.netavark,
+            with component_log(direpa_logs, repos.netavark.name):
+                install_netavark(
+                    repo=repos.netavark,
+                    sudo=sudo,
+                    direpa_pkg=direpa_pkg,
+                    rust_tag=repos.rust.tag,
+                    filenpa_mandown=filenpa_mandown,
+                )
+        if repos.aardvark_dns.tag is not None:
+            with component_log(direpa_logs, repos.aardvark_dns.name):
+                install_aardvark_dns(
+                    repo=repos.aardvark_dns,
+                    sudo=sudo,
+                    direpa_pkg=direpa_pkg,
+                    rust_tag=repos.rust.tag,
+                    filenpa_mandown=filenpa_mandown,
+                )
+
+    if repos.conmon.tag is not None:
+        with component_log(direpa_logs, repos.conmon.name):
+            install_conmon(
+                go_repo=repos.go,
+                conmon_repo=repos.conmon,
+                direpa_assets=direpa_assets,
                 sudo=sudo,
                 direpa_pkg=direpa_pkg,
-                rust_tag=repos.rust.tag,
-                filenpa_mandown=filenpa_mandown,
             )
-        if repos.aardvark_dns.tag is not None:
-            install_aardvark_dns(
-                repo=repos.aardvark_dns,
+    if repos.passt.tag is not None:
+        with component_log(direpa_logs, repos.passt.name):
+            install_passt(
+                repo=repos.passt,
                 sudo=sudo,
                 direpa_pkg=direpa_pkg,
-                rust_tag=repos.rust.tag,
-                filenpa_mandown=filenpa_mandown,
             )
-
-    if repos.conmon.tag is not None:
-        install_conmon(
-            go_repo=repos.go,
-            conmon_repo=repos.conmon,
-            direpa_assets=direpa_assets,
-            sudo=sudo,
-            direpa_pkg=direpa_pkg,
-        )
-    if repos.passt.tag is not None:
-        install_passt(
-            repo=repos.passt,
-            sudo=sudo,
-            direpa_pkg=direpa_pkg,
-        )
     if repos.runc.tag is not None:
-        install_runc(
-            go_repo=repos.go,
-            runc_repo=repos.runc,
-            direpa_assets=direpa_assets,
-            sudo=sudo,
-            direpa_pkg=direpa_pkg,
-        )
+        with component_log(direpa_logs, repos.runc.name):
+            install_runc(
+                go_repo=repos.go,
+                runc_repo=repos.runc,
+                direpa_assets=direpa_assets,
+                sudo=sudo,
+                direpa_pkg=direpa_pkg,
+            )
     if repos.slirp4netns.tag is not None:
-        install_slirp4netns(
-            repo=repos.slirp4netns,
+        with component_log(direpa_logs, repos.slirp4netns.name):
+            install_slirp4netns(
+                repo=repos.slirp4netns,
+                direpa_assets=direpa_assets,
+                sudo=sudo,
+                direpa_pkg=direpa_pkg,
+            )
+    with component_log(direpa_logs, repos.podman.name):
+        install_podman(
+            go_repo=repos.go,
+            podman_repo=repos.podman,
             direpa_assets=direpa_assets,
             sudo=sudo,
             direpa_pkg=direpa_pkg,
         )
-    install_podman(
-        go_repo=repos.go,
-        podman_repo=repos.podman,
-        direpa_assets=direpa_assets,
-        sudo=sudo,
-        direpa_pkg=direpa_pkg,
-    )
+    msg.info(f"Build logs index at '{os.path.join(direpa_logs, 'index.json')}'")
     info.description=info.description.strip()
     info.description+="\n .\n Build dependencies:\n"
-    dydata=json.loads(dump)
-    for key, dy in sorted(dydata.items()):
-        info.description+=f" * {dy['name']}: {dy['tag']} {dy['giturl']}\n"
+    for key, repo in sorted(vars(repos).items()):
+        info.description+=f" * {repo.name}: {repo.tag} {repo.giturl}\n"
 
     architecture=shell.cmd_get_value(["dpkg", "--print-architecture"])
     assert(architecture is not None)
     info.architecture=architecture
-    installed_size=generate_md5sums(direpa_pkg)
+    if strip is True:
+        for cmd in ["objcopy", "readelf"]:
+            if shutil.which(cmd) is None:
+                raise Exception(f"'{cmd}' is needed to strip binaries, install package binutils or use --no-strip.")
+        os.makedirs(os.path.join(direpa_dbgsym, "DEBIAN"), exist_ok=True)
+        installed_size, build_ids=generate_md5sums(direpa_pkg, direpa_dbgsym)
+    else:
+        installed_size, build_ids=generate_md5sums(direpa_pkg)
 
     with open(filenpa_control, "w") as f:
         f.write(f"""Package: {info.package}
@@ -253,26 +749,101 @@ Homepage: {info.homepage}
         
     os.makedirs(direpa_builds, exist_ok=True)
     filenpa_deb=os.path.join(direpa_builds, f"podman2deb-{info.architecture}-{info.version}.deb")
-    shell.cmd_prompt(["dpkg-deb", "-b", direpa_pkg, filenpa_deb])
+    publish_deb(direpa_pkg, filenpa_deb, epoch)
+
+    if len(build_ids) > 0 or os.path.exists(os.path.join(direpa_dbgsym, "usr")):
+        dbgsym_size, _=generate_md5sums(direpa_dbgsym)
+        with open(os.path.join(direpa_dbgsym, "DEBIAN", "control"), "w") as f:
+            f.write(f"""Package: {info.package}-dbgsym
+Architecture: {info.architecture}
+Version: {info.version}
+Section: debug
+Maintainer: {info.maintainer}
+Priority: optional
+Installed-Size: {dbgsym_size}
+Description: debug symbols for {info.package}
+Depends: {info.package} (= {info.version})
+Homepage: {info.homepage}
+""")
+            if len(build_ids) > 0:
+                f.write(f"Build-Ids: {' '.join(build_ids)}\n")
+        filenpa_dbgsym_deb=os.path.join(direpa_builds, f"podman2deb-dbgsym-{info.architecture}-{info.version}.deb")
+        publish_deb(direpa_dbgsym, filenpa_dbgsym_deb, epoch)
+
+def set_mirror(
+    repo:Repo,
+    update:bool,
+):
+    # bare mirror shared by all clones of the repo, git objects are only downloaded there.
+    # Only branches and tags are fetched (no refs/pull/*) and nothing is pruned, clones that use the mirror
+    # through alternates may still need objects of refs deleted upstream.
+    assert(repo.mirror is not None)
+    if os.path.exists(repo.mirror) is False:
+        msg.info(f"Mirror '{repo.name}' at '{repo.mirror}'")
+        os.makedirs(os.path.dirname(repo.mirror), exist_ok=True)
+        shell.cmd_prompt(["git", "clone", "--bare", repo.giturl, repo.mirror])
+        shell.cmd_prompt(["git", "-C", repo.mirror, "config", "remote.origin.fetch", "+refs/heads/*:refs/heads/*"])
+        shell.cmd_prompt(["git", "-C", repo.mirror, "config", "--add", "remote.origin.fetch", "+refs/tags/*:refs/tags/*"])
+        shell.cmd_prompt(["git", "-C", repo.mirror, "config", "gc.pruneExpire", "never"])
+    elif update is True:
+        msg.info(f"Mirror '{repo.name}' at '{repo.mirror}'")
+        shell.cmd_prompt(["git", "-C", repo.mirror, "fetch", "origin"])
+
+def add_alternates(direpa_repo:str, direpa_mirror:str):
+    # lets an existing clone read objects from the mirror, returns True when the mirror was added.
+    filenpa_alternates=os.path.join(direpa_repo, ".git", "objects", "info", "alternates")
+    direpa_objects=os.path.join(os.path.abspath(direpa_mirror), "objects")
+    alternates:list[str]=[]
+    if os.path.exists(filenpa_alternates):
+        with open(filenpa_alternates, "r") as f:
+            alternates=f.read().splitlines()
+    if direpa_objects in alternates:
+        return False
+    os.makedirs(os.path.dirname(filenpa_alternates), exist_ok=True)
+    with open(filenpa_alternates, "a") as f:
+        f.write(direpa_objects+"\n")
+    return True
 
 def set_repo(
     direpa_sources:str,
     repo:Repo,
     update:bool,
+    offline:bool=False,
 ):
+    # When repo.mirror is set, clones use it as reference (git alternates) and fetches go through it.
     direpa_repo=os.path.join(direpa_sources, repo.name)
     repo.path=direpa_repo
-    if os.path.exists(direpa_repo) is True:
+    if offline is True:
+        if os.path.exists(direpa_repo) is False:
+            raise Exception(f"Offline build, repo '{repo.name}' is not cloned at '{direpa_repo}', run --prefetch first.")
+    elif os.path.exists(direpa_repo) is True:
+        # the mirror is only created or fetched on update.
+        if update is True and repo.mirror is not None:
+            set_mirror(repo, update)
+            if add_alternates(direpa_repo, repo.mirror) is True:
+                # drop the local objects that are now in the mirror.
+                shell.cmd_prompt(["git", "-C", direpa_repo, "repack", "-a", "-d", "-l"])
+                shell.cmd_prompt(["git", "-C", direpa_repo, "prune-packed"])
         if update is True:
             msg.info(f"Repo '{repo.name}' at '{repo.giturl}'")
             os.chdir(direpa_repo)
-            shell.cmd_prompt(["git", "fetch", "--tags"])
+            if repo.mirror is None:
+                shell.cmd_prompt(["git", "fetch", "--tags"])
+            else:
+                shell.cmd_prompt(["git", "fetch", "--tags", repo.mirror])
     else:
         msg.info(f"Repo '{repo.name}' at '{repo.giturl}'")
-        if repo.name in [er.GO, er.RUST]:
-            shell.cmd_prompt(["git", "clone", repo.giturl, direpa_repo])
+        cmd=["git", "clone"]
+        if repo.name not in [er.GO, er.RUST]:
+            cmd.append("--recurse-submodules")
+        # without --update a missing mirror is not created, the clone comes from upstream and is attached to
+        # the mirror on the next --update.
+        if repo.mirror is None or (update is False and os.path.exists(repo.mirror) is False):
+            shell.cmd_prompt([*cmd, repo.giturl, direpa_repo])
         else:
-            shell.cmd_prompt(["git", "clone", "--recurse-submodules", repo.giturl, direpa_repo])
+            set_mirror(repo, update)
+            shell.cmd_prompt([*cmd, "--reference", repo.mirror, repo.mirror, direpa_repo])
+            shell.cmd_prompt(["git", "-C", direpa_repo, "remote", "set-url", "origin", repo.giturl])
 
 def get_commit_time(repo:Repo, tag:str):
     assert(repo.path is not None)
@@ -289,6 +860,7 @@ def get_commit_time(repo:Repo, tag:str):
     return datetime.strptime(output, "%Y-%m-%dT%H:%M:%S%z")
 
 def get_latest_tag(repo:Repo):
+    from ..gpkgs.semver import SemVer, semver
     assert(repo.path is not None)
     os.chdir(repo.path)
     output=shell.cmd_get_value([
@@ -308,6 +880,7 @@ def get_latest_tag(repo:Repo):
     raise Exception(f"No latest tag found at repo {repo.name}.")
 
 def get_closest_tag(repo:Repo, commit_time:datetime, trigger_error:bool=False):
+    from ..gpkgs.semver import semver
     assert(repo.path is not None)
     os.chdir(repo.path)
     output=shell.cmd_get_value([
@@ -340,6 +913,14 @@ def get_closest_tag(repo:Repo, commit_time:datetime, trigger_error:bool=False):
 
         versions=semver(tmp_tags, flatten=True, no_duplicates=True, skip_error=True, prefix=repo.prefix)
         versions=[v.replace("+", ".") for v in versions]
+        # semver ignores build metadata for precedence so four-part tags are sorted numerically, newest first.
+        # tags with non numeric parts i.e. v1.0.0.alpha are skipped.
+        keys:dict[str, list[int]]=dict()
+        for v in versions:
+            elems=v[len(repo.prefix):].split(".")
+            if all(e.isdigit() for e in elems):
+                keys[v]=[int(e) for e in elems]
+        versions=sorted(keys, key=lambda v: keys[v], reverse=True)
 
     else:
         versions=semver(tags, flatten=True, no_duplicates=True, skip_error=True, prefix=repo.prefix)
@@ -363,8 +944,19 @@ def list_tags(
     direpa_sources:str,
     repo:Repo,
     update:bool=False,
+    json_output:bool=False,
 ):
+    from ..gpkgs.semver import semver
+    if json_output is True:
+        with records_stream() as stream:
+            return stream_tags(stream, direpa_sources, repo, update)
+
     set_repo(direpa_sources, repo, update)
+    tags=get_tags(repo)
+    versions=sorted(semver(tags, flatten=True, no_duplicates=True, skip_error=True, prefix=repo.prefix))
+    return versions
+
+def get_tags(repo:Repo):
     assert(repo.path is not None)
     os.chdir(repo.path)
     output=shell.cmd_get_value([
@@ -372,7 +964,27 @@ def list_tags(
         "tag",
     ])
     assert(output is not None)
-    tags=output.splitlines()
-    versions=sorted(semver(tags, flatten=True, no_duplicates=True, skip_error=True, prefix=repo.prefix))
-    return versions
-    
\ No newline at end of file
+    return output.splitlines()
+
+def stream_tags(
+    stream:typing.TextIO,
+    direpa_sources:str,
+    repo:Repo,
+    update:bool=False,
+):
+    # tags are parsed and emitted one by one in git tag order, the sorted list is returned at the end.
+    from ..gpkgs.semver import semver
+    start=time.perf_counter()
+    set_repo(direpa_sources, repo, update)
+    versions:set[str]=set()
+    for t in get_tags(repo):
+        for v in semver([t], flatten=True, no_duplicates=True, skip_error=True, prefix=repo.prefix):
+            if v not in versions:
+                versions.add(v)
+                emit_record(stream, dict(
+                    type="tag",
+                    name=repo.name,
+                    tag=v,
+                    elapsed=round(time.perf_counter()-start, 6),
+                ))
+    return sorted(versions)
@@ -1,9 +1,5 @@
 #!/usr/bin/env python3
 
-from genericpath import exists
-import yaml
-
-
 if __name__ == "__main__":
     from pprint import pprint
     import json
@@ -33,15 +29,40 @@ if __name__ == "__main__":
     direpa_sources=os.path.join(direpa_script, "sources")
     direpa_builds=os.path.join(direpa_script, "builds")
     direpa_pkg=os.path.join(direpa_script, "pkg")
+    direpa_dbgsym=os.path.join(direpa_script, "pkg-dbgsym")
+    filenpa_lock=os.path.join(direpa_script, "podman2deb.lock")
+
+    if args.bench._here:
+        benchmarks=importlib.import_module(f"{module_name}.dev.benchmarks")
+        if args.bench.startup._here:
+            benchmarks.bench_startup(
+                direpa_script=direpa_script,
+                max_ms=args.bench.max_ms._value,
+            )
+        if args.bench.strip._here:
+            benchmarks.bench_strip()
+        if args.bench.tags._here:
+            benchmarks.bench_tags(
+                count=args.bench.tags.count._value or 2000,
+                max_ms=args.bench.max_ms._value,
+            )
+        sys.exit(0)
 
     os.makedirs(direpa_sources, exist_ok=True)
     direpa_assets=os.path.join(direpa_script, "assets")
     os.makedirs(direpa_assets, exist_ok=True)
+
+    import yaml
     info:"Debinfo"
     with open(filenpa_info, "r") as f:
         info=pkg.Debinfo(**yaml.safe_load(f))
         info.repos=[pkg.Repo(**r) for r in info.repos] #type:ignore
 
+    if args.mirror._here:
+        direpa_mirror=os.path.abspath(args.mirror._value)
+        for repo in info.repos:
+            repo.mirror=os.path.join(direpa_mirror, f"{repo.name}.git")
+
     # info:Debinfo,
     # direpa_sources:str,
     # direpa_assets:str,
@@ -63,23 +84,52 @@ if __name__ == "__main__":
         pkg.clean(
             direpa_sources=direpa_sources,
             direpa_pkg=direpa_pkg,
+            direpa_dbgsym=direpa_dbgsym,
             direpa_assets=direpa_assets,
             info=info,    
             sudo=sudo,
+            components=args.clean.components._values if args.clean.components._here else None,
+            stale=args.clean.stale._here,
+            jobs=args.clean.jobs._value,
+        )
+
+    if args.lock._here:
+        pkg.lock(
+            info,
+            direpa_sources=direpa_sources,
+            direpa_assets=direpa_assets,
+            filenpa_lock=filenpa_lock,
+            podman_tag=args.lock.tag._value,
+        )
+
+    if args.prefetch._here:
+        pkg.prefetch(
+            info,
+            direpa_sources=direpa_sources,
+            direpa_assets=direpa_assets,
+            podman_tag=args.prefetch.tag._value,
         )
 
     if args.list_tags._here:
         repo=[r for r in info.repos if r.name == pkg.RepoName.PODMAN][0]
-        print(json.dumps(pkg.list_tags(
-            direpa_sources, 
-            repo, 
-        ), indent=4))
+        if args.list_tags.json._here:
+            pkg.list_tags(
+                direpa_sources, 
+                repo, 
+                json_output=True,
+            )
+        else:
+            print(json.dumps(pkg.list_tags(
+                direpa_sources, 
+                repo, 
+            ), indent=4))
 
     if args.build_info._here:
         pkg.build_info(
             info,
             direpa_sources=direpa_sources,
             podman_tag=args.build_info.tag._value,
+            json_output=args.build_info.json._here,
         )
 
     if args.build._here:
@@ -89,7 +139,11 @@ if __name__ == "__main__":
             direpa_assets=direpa_assets,
             direpa_pkg=direpa_pkg,
             direpa_builds=direpa_builds,
+            direpa_dbgsym=direpa_dbgsym,
             sudo=sudo,
             podman_tag=args.build.tag._value,
+            strip=not args.build.no_strip._here,
+            offline=args.build.offline._here,
+            filenpa_lock=filenpa_lock if args.build.locked._here else None,
         )
 